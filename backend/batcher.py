@@ -0,0 +1,75 @@
+# backend/batcher.py
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+
+class AdaptiveBatcher:
+    """Coalesce concurrent requests into batches for one upstream dispatch.
+
+    Callers `await submit(item)` and get their individual result back; a
+    background coroutine collects up to `max_batch` items within a
+    `max_wait_ms` window and hands the whole batch to `handler`, which must
+    return one result per item (an Exception result is re-raised to that
+    item's waiter only).
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch: int = 8,
+        max_wait_ms: float = 20.0,
+    ):
+        self._handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its slot of the batch result."""
+        # Lazily start the consumer so the batcher can be built at import time
+        # (before any event loop exists).
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Block for the first item, then keep collecting until the batch
+            # is full or the wait window elapses.
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Dispatch detached so the collector keeps draining: awaiting a
+            # slow handler here would serialise batches behind one another and
+            # cap upstream concurrency at a single in-flight batch.
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[tuple]) -> None:
+        try:
+            results = await self._handler([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,51 @@
+# backend/export_emotion_onnx.py
+#
+# One-time helper: export the emotion model to ONNX and apply dynamic int8
+# quantisation. EmotionAnalyzer picks the result up automatically when the
+# output directory (EMOTION_ONNX_DIR, default "emotion_onnx_int8") exists.
+#
+#   python export_emotion_onnx.py
+#
+# Requires: pip install optimum[onnxruntime]
+
+import os
+import shutil
+import sys
+
+MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+EXPORT_DIR = "emotion_onnx_fp32"
+QUANT_DIR = os.getenv("EMOTION_ONNX_DIR", "emotion_onnx_int8")
+
+
+def main():
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+    except ImportError:
+        print("optimum[onnxruntime] is not installed; run: pip install optimum[onnxruntime]")
+        sys.exit(1)
+
+    # Step 1: export FP32 ONNX from the HF checkpoint.
+    print(f"Exporting {MODEL_NAME} to ONNX ({EXPORT_DIR})...")
+    model = ORTModelForSequenceClassification.from_pretrained(MODEL_NAME, export=True)
+    model.save_pretrained(EXPORT_DIR)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    tokenizer.save_pretrained(EXPORT_DIR)
+
+    # Step 2: dynamic int8 quantisation (weights int8, activations computed
+    # at runtime — no calibration set needed). avx512_vnni falls back safely
+    # on older CPUs at load time.
+    print(f"Quantising to int8 ({QUANT_DIR})...")
+    quantizer = ORTQuantizer.from_pretrained(EXPORT_DIR)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False)
+    quantizer.quantize(save_dir=QUANT_DIR, quantization_config=qconfig)
+    tokenizer.save_pretrained(QUANT_DIR)
+
+    # The FP32 export is only an intermediate artifact.
+    shutil.rmtree(EXPORT_DIR, ignore_errors=True)
+    print(f"Done. Start the server with EMOTION_ONNX_DIR={QUANT_DIR} (or leave the default).")
+
+
+if __name__ == "__main__":
+    main()
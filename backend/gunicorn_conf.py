@@ -0,0 +1,24 @@
+# backend/gunicorn_conf.py
+#
+# Multi-worker production server with copy-on-write model sharing:
+#
+#   gunicorn -c gunicorn_conf.py main:app
+#
+# preload_app imports main.py (and, via EMOTION_PRELOAD, loads the emotion
+# model) once in the master; fork() then shares the weight pages across all
+# workers copy-on-write instead of paying ~250 MB and a full load per worker.
+#
+# Note: fork-sharing is only safe with the model pinned on CPU — CUDA contexts
+# are not fork-safe. On GPU hosts drop EMOTION_PRELOAD and let each worker
+# load its own copy in the lifespan.
+
+import multiprocessing
+import os
+
+# Must be set before the master imports main.py (preload_app below).
+os.environ.setdefault("EMOTION_PRELOAD", "1")
+
+bind = os.getenv("BIND", "127.0.0.1:8001")
+workers = int(os.getenv("WEB_CONCURRENCY", str(max(2, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
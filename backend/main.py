@@ -1,15 +1,25 @@
 # backend/main.py
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-
+from typing import Callable, List, Optional, Dict, Any, Tuple
+from contextlib import asynccontextmanager
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
 import os
 import random
+import re
 
+import httpx
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APITimeoutError, AsyncOpenAI, RateLimitError
 
 # Gemini (may not be installed; handled gracefully)
 try:
@@ -17,45 +27,135 @@ try:
 except Exception:
     genai = None
 
+from batcher import AdaptiveBatcher
 from nlp.emotional_model import EmotionAnalyzer  # make sure filename matches
 from nlp.intent_detection import detect_intent
 from nlp.crisis_detection import is_crisis
+from nlp.llm_cache import LLMReplyCache
+from nlp.gemini_batch import GeminiBatchQueue
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger("neurocare")
+
+# Per-process RNG instance: keeps template selection off the global RNG's
+# shared state, which is a (GIL-held) contention point under concurrency.
+_rng = random.Random()
+
+# Both are pure functions of the (normalized) input string, so memoising them
+# turns repeat traffic (greetings, small talk, yes/no follow-ups) into an O(1)
+# hash lookup instead of a fresh keyword scan.
+_cached_detect_intent = functools.lru_cache(maxsize=2048)(detect_intent)
+_cached_is_crisis = functools.lru_cache(maxsize=2048)(is_crisis)
 
 
 # -----------------------------------------------------------------------------
 # Helper to detect generic/robotic AI replies
 # -----------------------------------------------------------------------------
 
+_BAD_PHRASES = (
+    "help me understand",
+    "tell me more about",
+    "what's really on your mind",
+    "i'm genuinely interested",
+    "i'm here to listen",
+    "i'd love to understand better",
+    "share a bit more",
+    "how it's affecting you",
+    "that sounds important",
+    "can you tell me more",
+    "what's going on",
+    "i'm here for you",
+    "would you like to talk about",
+    "i hear you",
+    "that must be",
+)
+
+# One compiled alternation finds any bad phrase in a single pass over the
+# text, instead of len(_BAD_PHRASES) separate substring scans.
+_BAD_RE = re.compile("|".join(re.escape(p) for p in _BAD_PHRASES))
+
+
+@functools.lru_cache(maxsize=4096)
 def is_generic_reply(text: str) -> bool:
-    """Detect generic, unhelpful AI responses that don't address the user's actual issue."""
-    bad_phrases = [
-        "help me understand",
-        "tell me more about",
-        "what's really on your mind",
-        "i'm genuinely interested",
-        "i'm here to listen",
-        "i'd love to understand better",
-        "share a bit more",
-        "how it's affecting you",
-        "that sounds important",
-        "can you tell me more",
-        "what's going on",
-        "i'm here for you",
-        "would you like to talk about",
-        "i hear you",
-        "that must be",
-    ]
-    t = text.lower()
-    # If the response contains multiple generic phrases or is too short, reject it
-    matches = sum(1 for p in bad_phrases if p in t)
-    return matches >= 1 or len(t) < 80
+    """Detect generic, unhelpful AI responses that don't address the user's actual issue.
+
+    Expects already-lowercased text so cache keys normalise properly.
+    """
+    # If the response contains a generic phrase or is too short, reject it
+    return bool(_BAD_RE.search(text)) or len(text) < 80
 
 
 # -----------------------------------------------------------------------------
 # FastAPI app + CORS
 # -----------------------------------------------------------------------------
 
-app = FastAPI(title="NeuroCare Mental Health Chatbot API")
+# Under Gunicorn --preload (see gunicorn_conf.py) EMOTION_PRELOAD=1 loads the
+# model at import time in the master, so fork() shares the weight pages
+# copy-on-write across every worker instead of loading N copies. Only safe on
+# CPU — CUDA contexts are not fork-safe.
+_preloaded_emotion: Optional[EmotionAnalyzer] = (
+    EmotionAnalyzer() if os.getenv("EMOTION_PRELOAD", "0") == "1" else None
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Without a preloaded model, the weights load on a worker thread *after*
+    # startup returns, so Uvicorn binds and accepts traffic in milliseconds
+    # instead of waiting seconds for DistilRoBERTa. Requests that arrive before
+    # the load finishes simply await the same future. EMOTION_EAGER_LOAD=1
+    # forces the load to finish before serving.
+    # Re-seed the per-process RNG: under --preload every worker forks with the
+    # master's RNG state and would otherwise replay identical template choices.
+    _rng.seed(os.urandom(16))
+    app.state.emotion = _preloaded_emotion
+    emotion_lock = asyncio.Lock()
+
+    async def get_emotion() -> EmotionAnalyzer:
+        if app.state.emotion is None:
+            async with emotion_lock:  # double-checked: load exactly once
+                if app.state.emotion is None:
+                    app.state.emotion = await asyncio.to_thread(EmotionAnalyzer)
+        return app.state.emotion
+
+    async def analyze_batch(texts):
+        analyzer = await get_emotion()
+        return await asyncio.to_thread(analyzer.analyze_batch, texts)
+
+    # Coalesce concurrent emotion lookups into one batched forward pass; the
+    # model call itself runs on a worker thread so the loop stays free.
+    app.state.emotion_batcher = AdaptiveBatcher(
+        analyze_batch,
+        max_batch=int(os.getenv("EMOTION_MAX_BATCH", "32")),
+        max_wait_ms=float(os.getenv("EMOTION_BATCH_WAIT_MS", "10.0")),
+    )
+
+    async def warmup():
+        # Prime the keyword-scanner memo caches and run one dummy inference
+        # so the first real request pays no one-time costs.
+        analyzer = await get_emotion()
+        _cached_detect_intent("warmup")
+        _cached_is_crisis("warmup")
+        await asyncio.to_thread(analyzer.analyze, "warmup")
+
+    if os.getenv("EMOTION_EAGER_LOAD", "0") == "1":
+        await warmup()
+        warmup_task = None
+    else:
+        warmup_task = asyncio.ensure_future(warmup())
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await _http_client.aclose()
+
+
+# orjson serialises the small JSON payloads this API returns several times
+# faster than the stdlib encoder, with fewer allocations per response.
+app = FastAPI(
+    title="NeuroCare Mental Health Chatbot API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -71,25 +171,39 @@ app.add_middleware(
 
 load_dotenv(dotenv_path=".env")
 
-# Emotion model
-emotion_analyzer = EmotionAnalyzer()
+# Emotion model is created in lifespan() and lives on app.state.emotion
+
+# Two-tier reply cache (exact LRU + semantic similarity) in front of the LLMs
+reply_cache = LLMReplyCache()
+
+# Batch Mode queue for priority="background" traffic: half-price, higher rate
+# limits, minutes-scale turnaround. No-op when the google-genai SDK or API key
+# is absent — those requests simply take the synchronous path.
+gemini_batch = GeminiBatchQueue()
+
+# One persistent HTTP client shared across all OpenAI calls: a warm, tuned
+# connection pool avoids a TCP+TLS handshake per request and survives bursts.
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    timeout=httpx.Timeout(30.0, connect=5.0),
+)
 
 # OpenAI client
 _OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 if _OPENAI_KEY and not _OPENAI_KEY.startswith("sk-REPLACE"):
     try:
-        client = OpenAI(api_key=_OPENAI_KEY)
-        print("OpenAI client initialised.")
+        client = AsyncOpenAI(api_key=_OPENAI_KEY, http_client=_http_client)
+        log.info("OpenAI client initialised.")
     except Exception as e:
-        print("OpenAI client init error:", e)
+        log.error("OpenAI client init error: %s", e)
         client = None
 else:
     client = None
-    print("OpenAI API key not found or placeholder — OpenAI client disabled.")
+    log.info("OpenAI API key not found or placeholder — OpenAI client disabled.")
 
 # Gemini client
 _GEMINI_KEY = os.getenv("GEMINI_API_KEY")
-print(f"DEBUG: GEMINI_API_KEY from env: {_GEMINI_KEY[:20] if _GEMINI_KEY else 'NOT FOUND'}...")
+log.debug("GEMINI_API_KEY prefix from env: %s", _GEMINI_KEY[:20] if _GEMINI_KEY else "NOT FOUND")
 if genai is not None and _GEMINI_KEY and _GEMINI_KEY.strip() != "":
     try:
         genai.configure(api_key=_GEMINI_KEY)
@@ -105,20 +219,116 @@ if genai is not None and _GEMINI_KEY and _GEMINI_KEY.strip() != "":
         for model_name in gemini_models_to_try:
             try:
                 gemini_model = genai.GenerativeModel(model_name)
-                print(f"Gemini client initialised with model: {model_name}")
+                log.info("Gemini client initialised with model: %s", model_name)
                 break
             except Exception as e:
-                print(f"Model {model_name} not available: {e}")
+                log.warning("Model %s not available: %s", model_name, e)
                 continue
         
         if gemini_model is None:
-            print("Gemini: No suitable model found. Using template responses.")
+            log.warning("Gemini: No suitable model found. Using template responses.")
     except Exception as e:
-        print("Gemini client init error:", e)
+        log.error("Gemini client init error: %s", e)
         gemini_model = None
 else:
     gemini_model = None
-    print("Gemini SDK not installed or GEMINI_API_KEY missing — Gemini disabled.")
+    log.info("Gemini SDK not installed or GEMINI_API_KEY missing — Gemini disabled.")
+
+# -----------------------------------------------------------------------------
+# LLM concurrency control
+# -----------------------------------------------------------------------------
+
+# Bound how many upstream calls may be in flight at once per provider, so a
+# thundering herd degrades into queueing instead of a 429/5xx cascade. The
+# caps are separate because the providers rate-limit independently — one
+# stalling must not starve the other.
+_OPENAI_SEM = asyncio.Semaphore(int(os.getenv("OPENAI_CONCURRENCY", "16")))
+_GEMINI_SEM = asyncio.Semaphore(int(os.getenv("GEMINI_CONCURRENCY", "16")))
+
+# Application-level backpressure: above this many in-flight requests the
+# middleware sheds load with a 503 instead of queueing unboundedly.
+_MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT_REQUESTS", "256"))
+_inflight = 0
+
+
+@app.middleware("http")
+async def shed_overload(request: Request, call_next):
+    """Fail fast when saturated: a prompt 503 + Retry-After beats a request
+    that queues for seconds and then times out anyway."""
+    global _inflight
+    if _inflight >= _MAX_INFLIGHT:
+        return ORJSONResponse(
+            {"detail": "Server is over capacity, please retry shortly."},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    _inflight += 1
+    try:
+        return await call_next(request)
+    finally:
+        _inflight -= 1
+
+# Hedged fanout: when enabled, race both providers and take the first reply.
+# The delay means the second request only goes out when the first is already
+# slow (~p50), capping the extra spend to the tail of the distribution.
+_HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+_HEDGE_MS = float(os.getenv("LLM_HEDGE_MS", "300"))
+
+_RETRYABLE_ERRORS: tuple = (RateLimitError, APITimeoutError)
+if genai is not None:
+    try:
+        from google.api_core.exceptions import DeadlineExceeded, ResourceExhausted
+        _RETRYABLE_ERRORS = _RETRYABLE_ERRORS + (ResourceExhausted, DeadlineExceeded)
+    except Exception:
+        pass
+
+
+async def _call_llm(make_call, sem: asyncio.Semaphore = _GEMINI_SEM):
+    """Run one upstream LLM call under the given provider semaphore.
+
+    Retries transient rate-limit/timeout errors with exponential backoff and
+    jitter; `make_call` must be a zero-arg callable returning a fresh
+    awaitable each attempt.
+    """
+    async with sem:
+        for attempt in range(4):
+            try:
+                return await make_call()
+            except _RETRYABLE_ERRORS:
+                if attempt == 3:
+                    raise
+                await asyncio.sleep(2 ** attempt + _rng.random())
+
+# -----------------------------------------------------------------------------
+# LLM micro-batching
+# -----------------------------------------------------------------------------
+
+async def _openai_batch_handler(batch: List[List[Dict[str, Any]]]) -> List[Any]:
+    """Dispatch one collected batch of message lists against OpenAI.
+
+    The calls are still distinct requests, but issuing them through one
+    asyncio.gather amortises event-loop overhead and reuses the client's
+    kept-alive connections. A self-hosted backend can later pack these into a
+    single completion call.
+    """
+    return await asyncio.gather(
+        *[
+            _call_llm(
+                lambda messages=messages: client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.9,
+                    max_tokens=420,
+                ),
+                sem=_OPENAI_SEM,
+            )
+            for messages in batch
+        ],
+        return_exceptions=True,
+    )
+
+
+openai_batcher = AdaptiveBatcher(_openai_batch_handler, max_batch=8, max_wait_ms=20.0)
 
 # -----------------------------------------------------------------------------
 # Pydantic models
@@ -127,6 +337,7 @@ else:
 class HistoryMessage(BaseModel):
     sender: str  # "user" or "bot"
     text: str
+    intent: Optional[str] = None  # set on bot messages so context can carry over
 
 
 class ChatRequest(BaseModel):
@@ -134,6 +345,28 @@ class ChatRequest(BaseModel):
     history: Optional[List[HistoryMessage]] = None
     user_id: Optional[str] = None
     mode: Optional[str] = "gemini"  # "gemini" | "openai"
+    priority: Optional[str] = None  # "background" routes Gemini via Batch Mode
+
+
+class LLMReply(BaseModel):
+    """Schema-constrained LLM output: each section arrives machine-parseable
+    instead of being fished out of freeform prose."""
+    acknowledgement: str  # mirrors the user's exact situation
+    validation: str  # names and validates the feeling
+    reframe: str  # gentle perspective shift
+    steps: List[str]  # 1-3 concrete actions to take right now
+    followup: str  # one specific question to continue the dialogue
+    disclaimer: str  # the one-sentence "not a professional" note
+
+
+class StructuredChatResponse(BaseModel):
+    reply: LLMReply
+    reply_text: str  # sections joined into the classic ChatResponse shape
+    emotion_label: str
+    emotion_score: float
+    intent: str
+    is_crisis: bool
+    llm_mode: str
 
 
 class ChatResponse(BaseModel):
@@ -142,7 +375,30 @@ class ChatResponse(BaseModel):
     emotion_score: float
     intent: str
     is_crisis: bool
-    llm_mode: str  # "gemini" | "openai" | "template"
+    llm_mode: str  # "gemini" | "openai" | "template" | "cache"
+
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+
+
+class BatchChatResponse(BaseModel):
+    responses: List[ChatResponse]  # same order as the requests
+
+
+# Run the SDK's schema conversion once at import so an incompatible LLMReply
+# shows up in the logs at boot instead of hiding behind the per-request
+# template fallback in generate_structured_reply.
+if gemini_model is not None:
+    try:
+        from google.generativeai.types import content_types as _content_types
+
+        _content_types._schema_for_class(LLMReply)
+    except Exception as e:
+        log.error(
+            "Gemini cannot convert the LLMReply schema — structured mode "
+            "will always fall back to templates: %r", e
+        )
+
 
 # -----------------------------------------------------------------------------
 # Template responses (fallback / simple intents / crisis)
@@ -206,106 +462,402 @@ RESPONSES = {
     ],
 }
 
+# Freeze the alternatives as tuples: immutable, slightly smaller, and safe to
+# share. The single crisis message gets its own constant since several call
+# sites need it directly.
+RESPONSES = {k: tuple(v) for k, v in RESPONSES.items()}
+CRISIS_REPLY = RESPONSES["crisis"][0]
+
+# Precompiled jump table: (intent, crisis_flag) -> zero-arg picker. Collapses
+# the lookup + branch + choice chain into one hash and one call, built once.
+_DISPATCH: Dict[Tuple[str, bool], Callable[[], str]] = {}
+for _intent, _options in RESPONSES.items():
+    _DISPATCH[(_intent, False)] = functools.partial(_rng.choice, _options)
+    _DISPATCH[(_intent, True)] = lambda _reply=CRISIS_REPLY: _reply
+_UNKNOWN_PICK = _DISPATCH[("unknown", False)]
+
 
 def choose_response(intent: str, crisis_flag: bool) -> str:
     if crisis_flag:
-        return RESPONSES["crisis"][0]
-    if intent in RESPONSES:
-        return random.choice(RESPONSES[intent])
-    return random.choice(RESPONSES["unknown"])
+        return CRISIS_REPLY
+    return _DISPATCH.get((intent, False), _UNKNOWN_PICK)()
 
 # -----------------------------------------------------------------------------
 # OpenAI-based reply (more human-like)
 # -----------------------------------------------------------------------------
 
-def generate_llm_reply(
+# Static system prompt, built once and identical across every request. Keeping
+# the user-specific bits (emotion/intent) OUT of this block means providers see
+# the same prefix tokens each call and can serve them from their prompt cache.
+_SYSTEM_PROMPT_OPENAI = (
+    "You are NeuroCare — a warm, deeply empathetic mental health support assistant. "
+    "Your role is to listen, validate, and gently guide. "
+    "You are NOT a medical professional, but you ARE genuinely compassionate. "
+    "\n\n"
+    "CRITICAL RESPONSE RULES:\n"
+    "1. FIRST SENTENCE: Directly acknowledge what the user shared. Reference specific words or emotions they mentioned. "
+    "Examples: 'I hear that you\'re feeling overwhelmed by your exams...' or 'It sounds like the pressure at work is really weighing on you...'\n"
+    "2. VALIDATION: Show you understand the weight of their feelings. Use phrases like 'That makes total sense,' 'It\'s completely understandable,' 'Your feelings are valid.'\n"
+    "3. REFRAME: Help them see their situation with gentle perspective. Maybe there's a strength they\'re not noticing, or a small step forward they\'ve already taken.\n"
+    "4. PRACTICAL HELP: Offer 1-3 specific, actionable suggestions. Not generic advice—match the suggestion to THEIR situation.\n"
+    "5. CONTINUE DIALOGUE: Ask ONE warm follow-up question that shows genuine curiosity about their experience.\n"
+    "6. LENGTH: 4-7 sentences. Be thorough but conversational.\n"
+    "7. TONE: Warm, natural, human. Like talking to a caring friend who truly gets it.\n"
+    "\n"
+    "Never repeat earlier responses. Never be generic. Every response is personalized to THIS user, THIS moment."
+)
+
+
+# tiktoken gives exact token counts for the history budget (may not be
+# installed or may lack its BPE files offline; the ~4-chars-per-token
+# heuristic is close enough for trimming either way).
+try:
+    import tiktoken
+    _TIKTOKEN_ENC = tiktoken.encoding_for_model("gpt-4o-mini")
+
+    def _count_tokens(text: str) -> int:
+        return len(_TIKTOKEN_ENC.encode(text))
+except Exception:
+    def _count_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+_HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+
+
+def trim_history(
+    history: Optional[List["HistoryMessage"]],
+    budget: int = _HISTORY_TOKEN_BUDGET,
+    max_turns: int = 8,
+) -> Optional[List["HistoryMessage"]]:
+    """Keep the newest turns that fit the token budget (and turn cap).
+
+    Prefill cost scales with uploaded tokens, so shipping fewer history
+    tokens directly cuts provider-side latency and spend. Walks newest to
+    oldest; always keeps at least the most recent turn.
+    """
+    if not history:
+        return None
+    kept = []
+    total = 0
+    for msg in reversed(history[-max_turns:]):
+        total += _count_tokens(msg.text)
+        if total > budget and kept:
+            break
+        kept.append(msg)
+    kept.reverse()
+    return kept
+
+
+def _build_openai_messages(
     user_message: str,
     emotion: str,
     intent: str,
-    crisis_flag: bool,
-    history: Optional[List[Dict[str, Any]]] = None,
-) -> str:
-    if crisis_flag:
-        return RESPONSES["crisis"][0]
-
-    if client is None:
-        print("DEBUG: OpenAI client None; using template fallback.")
-        return choose_response(intent, crisis_flag)
-
-    # Strong system prompt forcing specificity and referencing the user's text/intent
-    system_msg = (
-        "You are NeuroCare — a warm, deeply empathetic mental health support assistant. "
-        "Your role is to listen, validate, and gently guide. "
-        "You are NOT a medical professional, but you ARE genuinely compassionate. "
-        "\n\n"
-        "CRITICAL RESPONSE RULES:\n"
-        "1. FIRST SENTENCE: Directly acknowledge what the user shared. Reference specific words or emotions they mentioned. "
-        "Examples: 'I hear that you\'re feeling overwhelmed by your exams...' or 'It sounds like the pressure at work is really weighing on you...'\n"
-        "2. VALIDATION: Show you understand the weight of their feelings. Use phrases like 'That makes total sense,' 'It\'s completely understandable,' 'Your feelings are valid.'\n"
-        "3. REFRAME: Help them see their situation with gentle perspective. Maybe there's a strength they\'re not noticing, or a small step forward they\'ve already taken.\n"
-        "4. PRACTICAL HELP: Offer 1-3 specific, actionable suggestions. Not generic advice—match the suggestion to THEIR situation.\n"
-        "5. CONTINUE DIALOGUE: Ask ONE warm follow-up question that shows genuine curiosity about their experience.\n"
-        "6. LENGTH: 4-7 sentences. Be thorough but conversational.\n"
-        "7. TONE: Warm, natural, human. Like talking to a caring friend who truly gets it.\n"
-        "\n"
-        "Never repeat earlier responses. Never be generic. Every response is personalized to THIS user, THIS moment."
-    )
+    history: Optional[List["HistoryMessage"]] = None,
+) -> List[Dict[str, str]]:
+    """Assemble the chat.completions message list for one request.
 
-    messages = [{"role": "system", "content": system_msg}]
+    The system message is the frozen _SYSTEM_PROMPT_OPENAI; everything
+    user-specific lives in the trailing user turn.
+    """
+    messages = [{"role": "system", "content": _SYSTEM_PROMPT_OPENAI}]
 
     # add recent history (both user and assistant)
     if history:
         for msg in history[-8:]:
-            role = "user" if msg.get("sender") == "user" else "assistant"
+            role = "user" if msg.sender == "user" else "assistant"
             # include messages as-is to preserve context
-            messages.append({"role": role, "content": msg.get("text","")})
+            messages.append({"role": role, "content": msg.text})
 
     # Add explicit instruction / user turn
-    user_context = (
+    messages.append({"role": "user", "content": _build_openai_user_context(user_message, emotion, intent)})
+    return messages
+
+
+def _build_openai_user_context(user_message: str, emotion: str, intent: str) -> str:
+    """The per-turn user message: detected signals + instructions."""
+    return (
         f"(Detected emotion: {emotion}; detected intent: {intent})\n"
         f"USER: \"{user_message}\"\n\n"
         "Remember: mention the user's exact situation in the first sentence, validate feelings, "
         "give 1-3 relevant, realistic coping steps, and ask one gentle follow-up question. "
         "End with 'I am not a professional' disclaimer in one sentence."
     )
-    messages.append({"role": "user", "content": user_context})
+
+
+# Provider-side conversation state keyed by user_id. Reusing it means repeat
+# turns skip re-sending (and re-billing) the shared history prefix: OpenAI
+# retains context via previous_response_id, Gemini via a live ChatSession.
+_OPENAI_LAST_RESPONSE_ID: "TTLCache[str, str]" = TTLCache(maxsize=4096, ttl=3600)
+_GEMINI_SESSIONS: "TTLCache[str, Any]" = TTLCache(maxsize=1024, ttl=3600)
+
+
+async def generate_llm_reply(
+    user_message: str,
+    emotion: str,
+    intent: str,
+    crisis_flag: bool,
+    history: Optional[List["HistoryMessage"]] = None,
+    user_id: Optional[str] = None,
+) -> Tuple[str, bool]:
+    """Returns (reply, cacheable); template fallbacks are not cacheable."""
+    if crisis_flag:
+        return CRISIS_REPLY, False
+
+    if client is None:
+        log.debug("OpenAI client None; using template fallback.")
+        return choose_response(intent, crisis_flag), False
+
+    # Stateful path: let OpenAI carry the conversation server-side instead of
+    # re-uploading history every turn.
+    if user_id:
+        try:
+            previous_id = _OPENAI_LAST_RESPONSE_ID.get(user_id)
+            response = await _call_llm(
+                lambda: client.responses.create(
+                    model="gpt-4o-mini",
+                    instructions=_SYSTEM_PROMPT_OPENAI,
+                    input=_build_openai_user_context(user_message, emotion, intent),
+                    previous_response_id=previous_id,
+                    temperature=0.9,
+                    max_output_tokens=420,
+                ),
+                sem=_OPENAI_SEM,
+            )
+            _OPENAI_LAST_RESPONSE_ID[user_id] = response.id
+            return response.output_text.strip(), True
+        except Exception as e:
+            log.warning("OpenAI responses API error, retrying stateless: %r", e)
+            _OPENAI_LAST_RESPONSE_ID.pop(user_id, None)
+
+    messages = _build_openai_messages(user_message, emotion, intent, history)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0.9,
-            max_tokens=420,
-        )
-        assistant_text = response.choices[0].message.content.strip()
-        return assistant_text
+        response = await openai_batcher.submit(messages)
+        return response.choices[0].message.content.strip(), True
     except Exception as e:
-        print("OpenAI LLM error, falling back to template:", repr(e))
-        return choose_response(intent, crisis_flag)
+        log.warning("OpenAI LLM error, falling back to template: %r", e)
+        return choose_response(intent, crisis_flag), False
 
 # -----------------------------------------------------------------------------
 # Gemini-based reply (more human-like)
 # -----------------------------------------------------------------------------
 
-def generate_gemini_reply(
+async def generate_gemini_reply(
     user_message: str,
     emotion: str,
     intent: str,
     crisis_flag: bool,
-    history: Optional[List[Dict[str, Any]]] = None,
-) -> str:
+    history: Optional[List["HistoryMessage"]] = None,
+    user_id: Optional[str] = None,
+) -> Tuple[str, bool]:
+    """Returns (reply, cacheable); template fallbacks are not cacheable."""
     if crisis_flag:
-        return RESPONSES["crisis"][0]
+        return CRISIS_REPLY, False
 
     if intent in ("goodbye", "gratitude"):
-        return random.choice(RESPONSES.get(intent, RESPONSES["unknown"]))
+        return _rng.choice(RESPONSES.get(intent, RESPONSES["unknown"])), False
 
     if gemini_model is None:
-        print("DEBUG: Gemini model None; using template fallback.")
-        return get_smart_fallback(user_message, intent, emotion)
+        log.debug("Gemini model None; using template fallback.")
+        return get_smart_fallback(user_message, intent, emotion), False
+
+    try:
+        if user_id:
+            # Stateful path: a per-user ChatSession keeps the history on the
+            # session, so later turns only ship the new message.
+            session = _GEMINI_SESSIONS.get(user_id)
+            if session is None:
+                session = gemini_model.start_chat(history=[])
+                prompt = _build_gemini_prompt(user_message, emotion, intent, history)
+            else:
+                prompt = _build_gemini_turn(user_message, emotion, intent)
+            response = await _call_llm(lambda: session.send_message_async(prompt))
+            _GEMINI_SESSIONS[user_id] = session
+        else:
+            user_prompt = _build_gemini_prompt(user_message, emotion, intent, history)
+            response = await _call_llm(lambda: gemini_model.generate_content_async(user_prompt))
+        if hasattr(response, "text"):
+            reply_text = response.text.strip()
+        else:
+            reply_text = str(response).strip()
+
+        # Reject generic/robotic replies
+        if is_generic_reply(reply_text.lower()):
+            log.info("Rejected generic Gemini reply: %.100s...", reply_text)
+            return get_smart_fallback(user_message, intent, emotion), False
+
+        return reply_text, True
+    except Exception as e:
+        if user_id:
+            _GEMINI_SESSIONS.pop(user_id, None)
+        log.warning("Gemini error, falling back to smart response: %r", e)
+        return get_smart_fallback(user_message, intent, emotion), False
+
+
+async def generate_gemini_batch_reply(
+    user_message: str,
+    emotion: str,
+    intent: str,
+    crisis_flag: bool,
+    history: Optional[List["HistoryMessage"]] = None,
+    user_id: Optional[str] = None,
+) -> Tuple[str, bool]:
+    """Batch Mode variant of generate_gemini_reply for background traffic.
+
+    Same (reply, cacheable) contract; falls back to the synchronous path if
+    the batch submission fails rather than losing the request.
+    """
+    if crisis_flag:
+        return CRISIS_REPLY, False
+
+    if intent in ("goodbye", "gratitude"):
+        return _rng.choice(RESPONSES.get(intent, RESPONSES["unknown"])), False
+
+    prompt = _build_gemini_prompt(user_message, emotion, intent, history)
+    try:
+        reply_text = await gemini_batch.submit(prompt)
+    except Exception as e:
+        log.warning("Gemini batch path failed, using synchronous path: %r", e)
+        return await generate_gemini_reply(
+            user_message, emotion, intent, crisis_flag, history, user_id
+        )
 
-    # Much stricter prompt that forces specific, actionable responses
-    system_msg = f"""You are NeuroCare, a supportive mental health companion. Respond to the user naturally.
+    if is_generic_reply(reply_text.lower()):
+        log.info("Rejected generic Gemini batch reply: %.100s...", reply_text)
+        return get_smart_fallback(user_message, intent, emotion), False
+
+    return reply_text, True
+
+
+async def generate_reply_hedged(
+    user_message: str,
+    emotion: str,
+    intent: str,
+    crisis_flag: bool,
+    history: Optional[List["HistoryMessage"]] = None,
+    user_id: Optional[str] = None,
+    winner: Optional[Dict[str, str]] = None,
+) -> Tuple[str, bool]:
+    """Race Gemini against OpenAI and return whichever answers first.
+
+    Gemini starts immediately; OpenAI is only launched after _HEDGE_MS, so
+    the duplicate spend is limited to requests already in the latency tail.
+    The loser is cancelled. `winner` (if given) receives {"mode": ...} so the
+    endpoint can report which provider actually answered.
+    """
+    kwargs = dict(
+        user_message=user_message,
+        emotion=emotion,
+        intent=intent,
+        crisis_flag=crisis_flag,
+        history=history,
+        user_id=user_id,
+    )
+    t_gem = asyncio.create_task(generate_gemini_reply(**kwargs))
+    done, _ = await asyncio.wait({t_gem}, timeout=_HEDGE_MS / 1000)
+    if done:
+        if winner is not None:
+            winner["mode"] = "gemini"
+        return t_gem.result()
+
+    t_oai = asyncio.create_task(generate_llm_reply(**kwargs))
+    done, pending = await asyncio.wait({t_gem, t_oai}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    first = done.pop()
+    if winner is not None:
+        winner["mode"] = "gemini" if first is t_gem else "openai"
+    return first.result()
+
+
+def _join_structured(reply: LLMReply) -> str:
+    """Render the structured sections into the classic freeform reply shape."""
+    parts = [reply.acknowledgement, reply.validation, reply.reframe]
+    parts.extend(reply.steps)
+    parts.append(reply.followup)
+    parts.append(reply.disclaimer)
+    return " ".join(p for p in parts if p)
+
+
+def _fallback_structured(
+    user_message: str, intent: str, emotion: str, text: Optional[str] = None
+) -> LLMReply:
+    """Wrap a template/fallback reply in the LLMReply shape."""
+    return LLMReply(
+        acknowledgement=text or get_smart_fallback(user_message, intent, emotion),
+        validation="",
+        reframe="",
+        steps=[],
+        followup="",
+        disclaimer="I am not a professional—please reach out to one if this feels heavy.",
+    )
+
+
+async def generate_structured_reply(
+    user_message: str,
+    emotion: str,
+    intent: str,
+    crisis_flag: bool,
+    history: Optional[List["HistoryMessage"]] = None,
+    mode: str = "gemini",
+) -> Tuple[LLMReply, str]:
+    """Returns (structured reply, llm_mode).
+
+    Both providers are asked to emit JSON conforming to LLMReply's schema, so
+    the output is deterministic to parse — no second "repair" round-trip when
+    a freeform reply misses a required section.
+    """
+    if crisis_flag:
+        return _fallback_structured(user_message, intent, emotion, CRISIS_REPLY), "template"
+
+    if mode == "openai" and client is not None:
+        try:
+            messages = _build_openai_messages(user_message, emotion, intent, history)
+            response = await _call_llm(
+                lambda: client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.9,
+                    max_tokens=420,
+                    response_format={
+                        "type": "json_schema",
+                        "json_schema": {
+                            "name": "neurocare_reply",
+                            "schema": LLMReply.model_json_schema(),
+                        },
+                    },
+                ),
+                sem=_OPENAI_SEM,
+            )
+            return LLMReply(**json.loads(response.choices[0].message.content)), "openai"
+        except Exception as e:
+            log.warning("Structured OpenAI error, using template fallback: %r", e)
+    elif gemini_model is not None:
+        try:
+            prompt = _build_gemini_prompt(user_message, emotion, intent, history)
+            response = await _call_llm(
+                lambda: gemini_model.generate_content_async(
+                    prompt,
+                    generation_config={
+                        "response_mime_type": "application/json",
+                        # The SDK converts the Pydantic class itself; the raw
+                        # model_json_schema() dict carries "title" fields the
+                        # Schema proto rejects.
+                        "response_schema": LLMReply,
+                    },
+                )
+            )
+            return LLMReply(**json.loads(response.text)), "gemini"
+        except Exception as e:
+            log.warning("Structured Gemini error, using template fallback: %r", e)
+
+    return _fallback_structured(user_message, intent, emotion), "template"
+
+
+# Static Gemini prompt prefix — much stricter wording that forces specific,
+# actionable responses. Per-request intent/emotion live in the dynamic tail so
+# this block stays byte-identical (and provider-cacheable) across requests.
+_SYSTEM_PROMPT_GEMINI = """You are NeuroCare, a supportive mental health companion. Respond to the user naturally.
 
 CRITICAL RULES (MUST FOLLOW):
 1. NEVER say "tell me more", "I'd love to understand", "share more", "what's on your mind" or similar deflecting phrases
@@ -315,100 +867,114 @@ CRITICAL RULES (MUST FOLLOW):
 5. End with ONE specific follow-up question about their situation
 6. Keep response 3-5 sentences, warm but direct
 
-The user's intent is: {intent}
-The user's emotion is: {emotion}
-
 BAD RESPONSE EXAMPLE (DO NOT DO THIS):
 "That sounds important to you. I'd love to understand better—can you share a bit more?"
 
 GOOD RESPONSE EXAMPLE:
-"Being exhausted before exams is really tough—your body and mind are already stretched thin. Here's what can help right now: try the 25-5 technique (25 min focused study, 5 min break), keep water nearby, and pick just ONE topic to review tonight. Which subject feels most overwhelming?"""
+"Being exhausted before exams is really tough—your body and mind are already stretched thin. Here's what can help right now: try the 25-5 technique (25 min focused study, 5 min break), keep water nearby, and pick just ONE topic to review tonight. Which subject feels most overwhelming?\""""
+
+
+def _build_gemini_prompt(
+    user_message: str,
+    emotion: str,
+    intent: str,
+    history: Optional[List["HistoryMessage"]] = None,
+) -> str:
+    """Assemble the full Gemini text prompt for one request.
 
-    # Build conversation text for Gemini (text prompt)
-    history_text = ""
+    Static prefix first, then everything user-specific.
+    """
+    # Build conversation text for Gemini (text prompt); collect parts and join
+    # once instead of growing an immutable string per turn
+    parts = []
     if history:
         for msg in history[-6:]:
-            role = "User" if msg.get("sender") == "user" else "NeuroCare"
-            history_text += f"{role}: {msg.get('text','')}\n"
-
-    user_prompt = (
-        f"{system_msg}\n\n"
-        f"Conversation history:\n{history_text}\n"
-        f"User says: \"{user_message}\"\n\n"
-        f"Give a helpful, specific response (NOT generic):"
-    )
+            parts.append("User: " if msg.sender == "user" else "NeuroCare: ")
+            parts.append(msg.text)
+            parts.append("\n")
+    history_text = "".join(parts)
+
+    return "".join((
+        _SYSTEM_PROMPT_GEMINI,
+        "\n\nThe user's intent is: ", intent,
+        "\nThe user's emotion is: ", emotion,
+        "\n\nConversation history:\n", history_text,
+        "\nUser says: \"", user_message,
+        "\"\n\nGive a helpful, specific response (NOT generic):",
+    ))
+
+
+def _build_gemini_turn(user_message: str, emotion: str, intent: str) -> str:
+    """Follow-up turn for a live ChatSession: just the new signals + message.
+
+    The system rules and earlier history already live on the session.
+    """
+    return "".join((
+        "The user's intent is: ", intent,
+        "\nThe user's emotion is: ", emotion,
+        "\n\nUser says: \"", user_message,
+        "\"\n\nGive a helpful, specific response (NOT generic):",
+    ))
+
+
+# Smart-fallback responses, hoisted and frozen as tuples so they are built
+# once and can never be mutated at runtime
+_EXAM_RESPONSES = (
+    "Exams can feel overwhelming, especially when you're already tired. Here's a quick strategy: break your study into 25-minute focused blocks with 5-minute breaks. Pick just ONE topic to master tonight instead of everything. What subject is weighing on you the most?",
+    "I hear you—exam pressure is real and exhausting. Try this: write down the 3 most important topics, tackle the easiest one first to build momentum, and get at least 6 hours of sleep (your brain consolidates memory while sleeping). Which exam is coming up first?",
+    "Exam stress hits hard. Let's make it manageable: create a mini checklist of just 3 things to review tonight. Done is better than perfect. Also, a 10-minute walk can actually boost your memory retention. What's the exam on?",
+)
 
-    try:
-        response = gemini_model.generate_content(user_prompt)
-        if hasattr(response, "text"):
-            reply_text = response.text.strip()
-        else:
-            reply_text = str(response).strip()
+_TIREDNESS_RESPONSES = (
+    "Feeling exhausted is your body telling you it needs care. Right now: drink a glass of water, do 10 deep breaths, and if possible take a 20-minute power nap (set an alarm!). What's been draining your energy lately?",
+    "Exhaustion makes everything harder. Here's what helps: splash cold water on your face, step outside for 2 minutes of fresh air, and eat something with protein. Are you getting enough sleep at night?",
+    "When you're this tired, small wins matter. Try: stretch for 60 seconds, have a healthy snack, and tackle just ONE small task. Your energy will come back. What's been keeping you up?",
+)
 
-        # Reject generic/robotic replies
-        if is_generic_reply(reply_text):
-            print(f"⚠️ Rejected generic Gemini reply: {reply_text[:100]}...")
-            return get_smart_fallback(user_message, intent, emotion)
+_ANXIETY_RESPONSES = (
+    "Anxiety can feel overwhelming, but let's ground you. Try this now: name 5 things you can see, 4 you can touch, 3 you can hear. This brings you back to the present moment. What's triggering the anxiety right now?",
+    "When anxiety hits, your body goes into overdrive. Here's a quick reset: breathe in for 4 counts, hold for 4, out for 6. Repeat 3 times. This activates your calm response. What specific worry is loudest right now?",
+    "Anxiety is tough but manageable. Right now: unclench your jaw, drop your shoulders, and take 3 slow breaths. Write down what's worrying you—getting it out of your head helps. What feels most urgent?",
+)
 
-        return reply_text
-    except Exception as e:
-        print("Gemini error, falling back to smart response:", repr(e))
-        return get_smart_fallback(user_message, intent, emotion)
+_SADNESS_RESPONSES = (
+    "I'm really sorry you're feeling this way. Sadness is valid and it's okay to not be okay. One small step: reach out to one person today, even just a text. You don't have to go through this alone. What's been weighing on your heart?",
+    "Feeling down is hard, and I want you to know your feelings matter. Try this: do one tiny thing that usually brings comfort—a warm drink, a favorite song, or just sitting in sunlight for 5 minutes. When did this feeling start?",
+    "Sadness can feel isolating. Here's something gentle: write down 3 things that went okay today (even tiny things count). Your brain needs reminders of the good. Would you like to talk about what's making you sad?",
+)
+
+_STRESS_RESPONSES = (
+    "Stress can pile up fast. Let's break it down: what's the ONE thing that would make the biggest difference if you handled it today? Focus there first. Everything else can wait. What's stressing you most?",
+    "When everything feels urgent, nothing gets done. Try this: write down everything stressing you, then circle just the top 2. Tackle those and let the rest go for now. What's at the top of your list?",
+    "Feeling overwhelmed means you care, and that's not a bad thing. But let's get practical: take 5 minutes to just breathe, then pick ONE small task to complete. Progress beats perfection. What's the first thing you can check off?",
+)
+
+# One dispatch table instead of six successive keyword scans. Order matters:
+# first row whose intent matches or whose keywords intersect the message wins.
+_FALLBACK_TABLE = (
+    ("exams", frozenset({"exam", "exams", "test", "tests", "study"}), _EXAM_RESPONSES),
+    ("tiredness", frozenset({"tired", "exhausted", "sleepy", "energy"}), _TIREDNESS_RESPONSES),
+    ("anxiety", frozenset({"anxious", "worried", "nervous", "panic"}), _ANXIETY_RESPONSES),
+    ("sadness", frozenset({"sad", "depressed", "hopeless", "lonely"}), _SADNESS_RESPONSES),
+    ("stress", frozenset({"stressed", "pressure", "overwhelmed"}), _STRESS_RESPONSES),
+)
+
+_WORD_RE = re.compile(r"[a-z']+")
 
 
 def get_smart_fallback(user_message: str, intent: str, emotion: str) -> str:
     """Generate context-aware fallback responses based on intent and user message."""
-    msg_lower = user_message.lower()
-    
-    # Exam-related responses
-    if intent == "exams" or any(w in msg_lower for w in ["exam", "test", "study"]):
-        responses = [
-            f"Exams can feel overwhelming, especially when you're already tired. Here's a quick strategy: break your study into 25-minute focused blocks with 5-minute breaks. Pick just ONE topic to master tonight instead of everything. What subject is weighing on you the most?",
-            f"I hear you—exam pressure is real and exhausting. Try this: write down the 3 most important topics, tackle the easiest one first to build momentum, and get at least 6 hours of sleep (your brain consolidates memory while sleeping). Which exam is coming up first?",
-            f"Exam stress hits hard. Let's make it manageable: create a mini checklist of just 3 things to review tonight. Done is better than perfect. Also, a 10-minute walk can actually boost your memory retention. What's the exam on?"
-        ]
-        return random.choice(responses)
-    
-    # Tiredness/exhaustion responses
-    if intent == "tiredness" or any(w in msg_lower for w in ["tired", "exhausted", "sleepy", "no energy"]):
-        responses = [
-            f"Feeling exhausted is your body telling you it needs care. Right now: drink a glass of water, do 10 deep breaths, and if possible take a 20-minute power nap (set an alarm!). What's been draining your energy lately?",
-            f"Exhaustion makes everything harder. Here's what helps: splash cold water on your face, step outside for 2 minutes of fresh air, and eat something with protein. Are you getting enough sleep at night?",
-            f"When you're this tired, small wins matter. Try: stretch for 60 seconds, have a healthy snack, and tackle just ONE small task. Your energy will come back. What's been keeping you up?"
-        ]
-        return random.choice(responses)
-    
-    # Anxiety responses
-    if intent == "anxiety" or any(w in msg_lower for w in ["anxious", "worried", "nervous", "panic"]):
-        responses = [
-            f"Anxiety can feel overwhelming, but let's ground you. Try this now: name 5 things you can see, 4 you can touch, 3 you can hear. This brings you back to the present moment. What's triggering the anxiety right now?",
-            f"When anxiety hits, your body goes into overdrive. Here's a quick reset: breathe in for 4 counts, hold for 4, out for 6. Repeat 3 times. This activates your calm response. What specific worry is loudest right now?",
-            f"Anxiety is tough but manageable. Right now: unclench your jaw, drop your shoulders, and take 3 slow breaths. Write down what's worrying you—getting it out of your head helps. What feels most urgent?"
-        ]
-        return random.choice(responses)
-    
-    # Sadness responses  
-    if intent == "sadness" or any(w in msg_lower for w in ["sad", "depressed", "hopeless", "lonely"]):
-        responses = [
-            f"I'm really sorry you're feeling this way. Sadness is valid and it's okay to not be okay. One small step: reach out to one person today, even just a text. You don't have to go through this alone. What's been weighing on your heart?",
-            f"Feeling down is hard, and I want you to know your feelings matter. Try this: do one tiny thing that usually brings comfort—a warm drink, a favorite song, or just sitting in sunlight for 5 minutes. When did this feeling start?",
-            f"Sadness can feel isolating. Here's something gentle: write down 3 things that went okay today (even tiny things count). Your brain needs reminders of the good. Would you like to talk about what's making you sad?"
-        ]
-        return random.choice(responses)
-    
-    # Stress responses
-    if intent == "stress" or any(w in msg_lower for w in ["stressed", "pressure", "overwhelmed"]):
-        responses = [
-            f"Stress can pile up fast. Let's break it down: what's the ONE thing that would make the biggest difference if you handled it today? Focus there first. Everything else can wait. What's stressing you most?",
-            f"When everything feels urgent, nothing gets done. Try this: write down everything stressing you, then circle just the top 2. Tackle those and let the rest go for now. What's at the top of your list?",
-            f"Feeling overwhelmed means you care, and that's not a bad thing. But let's get practical: take 5 minutes to just breathe, then pick ONE small task to complete. Progress beats perfection. What's the first thing you can check off?"
-        ]
-        return random.choice(responses)
-    
+    # Lowercase + tokenize once; set intersection replaces substring scans
+    tokens = frozenset(_WORD_RE.findall(user_message.lower()))
+
+    for intent_name, keywords, responses in _FALLBACK_TABLE:
+        if intent == intent_name or tokens & keywords:
+            return _rng.choice(responses)
+
     # Greeting responses
     if intent == "greeting":
         return "Hey! I'm glad you're here. How are you really feeling today? Don't hold back—I'm here to help with whatever's on your mind."
-    
+
     # Default fallback - still specific and helpful
     return f"I want to give you real support, not generic advice. You mentioned '{user_message[:50]}{'...' if len(user_message) > 50 else ''}'. Can you tell me a bit more about what's happening so I can offer something actually useful? What's the main thing you're dealing with right now?"
 
@@ -416,59 +982,103 @@ def get_smart_fallback(user_message: str, intent: str, emotion: str) -> str:
 # API routes
 # -----------------------------------------------------------------------------
 
-@app.post("/api/chat", response_model=ChatResponse)
-def chat_endpoint(payload: ChatRequest):
+# Exact-duplicate request cache (client retries, double taps): identical
+# (mode, message, recent history) tuples short-circuit the whole pipeline for
+# five minutes. The semantic cache handles near-duplicates further down.
+_RESP_CACHE: "TTLCache[bytes, ChatResponse]" = TTLCache(maxsize=4096, ttl=300)
+
+
+def _response_cache_key(payload: ChatRequest) -> bytes:
+    raw = repr((
+        payload.mode,
+        payload.message.strip().lower(),
+        tuple((m.sender, m.text) for m in (payload.history or [])[-4:]),
+    ))
+    return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+
+
+async def _chat_core(payload: ChatRequest, request: Request) -> ChatResponse:
+    """Analysis + reply generation for one message (shared by /api/chat and
+    /api/chat/batch)."""
     user_message = payload.message
     history = payload.history or []
-    history_list: Optional[List[Dict[str, Any]]] = [m.model_dump() for m in history] if history else None
-
-    # 1. Emotion
-    emo = emotion_analyzer.analyze(user_message)
+    # Pass the parsed HistoryMessage objects straight through, trimmed to the
+    # token budget — no model_dump() dicts, no oversized prefill uploads.
+    history_list: Optional[List[HistoryMessage]] = trim_history(history)
+
+    # 1-3. Emotion, intent, and crisis detection are independent of each other,
+    # so run them concurrently: the (batched) model inference overlaps the
+    # memoised keyword scans on worker threads.
+    normalized_message = user_message.strip().lower()
+    emo, intent, crisis_hit = await asyncio.gather(
+        request.app.state.emotion_batcher.submit(user_message),
+        asyncio.to_thread(_cached_detect_intent, normalized_message),
+        asyncio.to_thread(_cached_is_crisis, normalized_message),
+    )
     emotion_label = emo["label"]
     emotion_score = emo["score"]
 
-    # 2. Intent
-    intent = detect_intent(user_message)
-
-    # Preserve last intent if current message is short or vague
-    if history_list:
-        last_bot_msg = next((m for m in reversed(history_list) if m.get("sender") == "bot"), None)
-        if last_bot_msg:
-            last_intent = last_bot_msg.get("intent")
-            if intent == "unknown" and last_intent:
-                intent = last_intent
+    # Preserve last intent if current message is short or vague: one reverse
+    # walk over the Pydantic models, no intermediate dicts
+    if intent == "unknown":
+        last_bot_msg = next((m for m in reversed(history) if m.sender == "bot"), None)
+        if last_bot_msg is not None and last_bot_msg.intent:
+            intent = last_bot_msg.intent
 
-    # 3. Crisis detection
-    crisis_flag = is_crisis(user_message) or (intent == "crisis")
+    crisis_flag = crisis_hit or (intent == "crisis")
 
     requested_mode = (payload.mode or "gemini").lower()
 
     if crisis_flag:
-        reply = RESPONSES["crisis"][0]
+        reply = CRISIS_REPLY
         llm_mode = "template"
     else:
-        if requested_mode == "gemini" and gemini_model is not None:
-            reply = generate_gemini_reply(
-                user_message=user_message,
-                emotion=emotion_label,
-                intent=intent,
-                crisis_flag=crisis_flag,
-                history=history_list,
-            )
+        hedge_winner: Dict[str, str] = {}
+        if (
+            _HEDGE_ENABLED
+            and payload.priority != "background"
+            and gemini_model is not None
+            and client is not None
+        ):
+            generate = functools.partial(generate_reply_hedged, winner=hedge_winner)
+            llm_mode = requested_mode
+        elif requested_mode == "gemini" and gemini_model is not None:
+            if payload.priority == "background" and gemini_batch.enabled:
+                generate = generate_gemini_batch_reply
+            else:
+                generate = generate_gemini_reply
             llm_mode = "gemini"
         elif requested_mode == "openai" and client is not None:
-            reply = generate_llm_reply(
-                user_message=user_message,
-                emotion=emotion_label,
-                intent=intent,
-                crisis_flag=crisis_flag,
-                history=history_list,
-            )
+            generate = generate_llm_reply
             llm_mode = "openai"
         else:
+            generate = None
             reply = choose_response(intent, crisis_flag)
             llm_mode = "template"
 
+        if generate is not None:
+            # Two-tier cache: exact key first, then semantic similarity; the
+            # provider is only hit on a full miss.
+            last_turn = history[-1].text if history else ""
+            reply, cache_hit = await reply_cache.get_or_compute(
+                key=(requested_mode, intent, emotion_label, normalized_message, last_turn),
+                message=user_message,
+                intent=intent,
+                crisis_flag=crisis_flag,
+                compute=lambda: generate(
+                    user_message=user_message,
+                    emotion=emotion_label,
+                    intent=intent,
+                    crisis_flag=crisis_flag,
+                    history=history_list,
+                    user_id=payload.user_id,
+                ),
+            )
+            if cache_hit:
+                llm_mode = "cache"
+            elif hedge_winner:
+                llm_mode = hedge_winner["mode"]
+
     return ChatResponse(
         reply=reply,
         emotion_label=emotion_label,
@@ -479,6 +1089,194 @@ def chat_endpoint(payload: ChatRequest):
     )
 
 
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat_endpoint(payload: ChatRequest, request: Request, response: Response):
+    cache_key = _response_cache_key(payload)
+    etag = cache_key.hex()
+    response.headers["ETag"] = etag
+    cached = _RESP_CACHE.get(cache_key)
+    if cached is not None:
+        # Client already holds this exact response (If-None-Match echoes our
+        # ETag, quoted or not): 304 with no body beats re-sending the JSON.
+        if request.headers.get("if-none-match", "").strip('"W/') == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return cached
+
+    chat_response = await _chat_core(payload, request)
+    _RESP_CACHE[cache_key] = chat_response
+    return chat_response
+
+
+@app.post("/api/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(payload: BatchChatRequest, request: Request):
+    """Process many messages in one HTTP round trip.
+
+    The per-message pipelines run under one asyncio.gather, so their emotion
+    lookups coalesce into a single batched forward pass (via the adaptive
+    batcher) and the LLM calls fan out concurrently. Responses come back in
+    request order.
+    """
+    responses = await asyncio.gather(
+        *[_chat_core(item, request) for item in payload.requests]
+    )
+    return BatchChatResponse(responses=list(responses))
+
+
+def _sse(data: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(payload: ChatRequest, request: Request):
+    """Streaming variant of /api/chat using Server-Sent Events.
+
+    Tokens are forwarded to the client as they arrive from the provider, so
+    the first words render in ~200 ms instead of after full generation. The
+    final event carries the complete reply (after the generic-reply check,
+    which may swap in a smart fallback) plus the analysis metadata.
+    """
+    user_message = payload.message
+    history = payload.history or []
+    history_list: Optional[List[HistoryMessage]] = trim_history(history)
+
+    normalized_message = user_message.strip().lower()
+    emo, intent, crisis_hit = await asyncio.gather(
+        request.app.state.emotion_batcher.submit(user_message),
+        asyncio.to_thread(_cached_detect_intent, normalized_message),
+        asyncio.to_thread(_cached_is_crisis, normalized_message),
+    )
+    emotion_label = emo["label"]
+    crisis_flag = crisis_hit or (intent == "crisis")
+    requested_mode = (payload.mode or "gemini").lower()
+
+    async def event_generator():
+        def done_event(reply: str, llm_mode: str) -> str:
+            return _sse({
+                "done": True,
+                "reply": reply,
+                "emotion_label": emotion_label,
+                "emotion_score": emo["score"],
+                "intent": intent,
+                "is_crisis": crisis_flag,
+                "llm_mode": llm_mode,
+            })
+
+        # Crisis and template paths have nothing to stream — send in one shot
+        if crisis_flag:
+            reply = CRISIS_REPLY
+            yield _sse({"delta": reply})
+            yield done_event(reply, "template")
+            return
+
+        if requested_mode == "gemini" and gemini_model is not None:
+            prompt = _build_gemini_prompt(user_message, emotion_label, intent, history_list)
+            parts = []
+            try:
+                response = await _call_llm(
+                    lambda: gemini_model.generate_content_async(prompt, stream=True)
+                )
+                async for chunk in response:
+                    text = getattr(chunk, "text", "") or ""
+                    if text:
+                        parts.append(text)
+                        yield _sse({"delta": text})
+            except Exception as e:
+                log.warning("Gemini stream error, falling back to smart response: %r", e)
+                reply = get_smart_fallback(user_message, intent, emotion_label)
+                yield _sse({"delta": reply})
+                yield done_event(reply, "template")
+                return
+
+            reply = "".join(parts).strip()
+            if is_generic_reply(reply.lower()):
+                reply = get_smart_fallback(user_message, intent, emotion_label)
+                yield _sse({"delta": reply})
+            yield done_event(reply, "gemini")
+            return
+
+        if requested_mode == "openai" and client is not None:
+            messages = _build_openai_messages(user_message, emotion_label, intent, history_list)
+            parts = []
+            try:
+                stream = await _call_llm(
+                    lambda: client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=messages,
+                        temperature=0.9,
+                        max_tokens=420,
+                        stream=True,
+                    ),
+                    sem=_OPENAI_SEM,
+                )
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield _sse({"delta": delta})
+            except Exception as e:
+                log.warning("OpenAI stream error, falling back to template: %r", e)
+                reply = choose_response(intent, crisis_flag)
+                yield _sse({"delta": reply})
+                yield done_event(reply, "template")
+                return
+
+            yield done_event("".join(parts).strip(), "openai")
+            return
+
+        reply = choose_response(intent, crisis_flag)
+        yield _sse({"delta": reply})
+        yield done_event(reply, "template")
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            # Keep intermediaries from buffering the stream — without these a
+            # reverse proxy can hold events back and erase the TTFT win.
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.post("/api/chat/structured", response_model=StructuredChatResponse)
+async def chat_structured_endpoint(payload: ChatRequest, request: Request):
+    """Schema-constrained variant of /api/chat for richer UIs.
+
+    The reply arrives as typed sections (acknowledgement, steps, followup,
+    ...) that the frontend can render directly; reply_text carries the same
+    content joined into the classic freeform shape.
+    """
+    user_message = payload.message
+    history_list = trim_history(payload.history)
+
+    normalized_message = user_message.strip().lower()
+    emo, intent, crisis_hit = await asyncio.gather(
+        request.app.state.emotion_batcher.submit(user_message),
+        asyncio.to_thread(_cached_detect_intent, normalized_message),
+        asyncio.to_thread(_cached_is_crisis, normalized_message),
+    )
+    crisis_flag = crisis_hit or (intent == "crisis")
+
+    reply, llm_mode = await generate_structured_reply(
+        user_message=user_message,
+        emotion=emo["label"],
+        intent=intent,
+        crisis_flag=crisis_flag,
+        history=history_list,
+        mode=(payload.mode or "gemini").lower(),
+    )
+    return StructuredChatResponse(
+        reply=reply,
+        reply_text=_join_structured(reply),
+        emotion_label=emo["label"],
+        emotion_score=emo["score"],
+        intent=intent,
+        is_crisis=crisis_flag,
+        llm_mode=llm_mode,
+    )
+
+
 @app.get("/")
 def root():
     return {
@@ -498,4 +1296,14 @@ def health():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8001)
+    # One worker per core plus the C-level event loop (uvloop) and HTTP parser
+    # (httptools); workers>1 requires the import-string form of the app.
+    uvicorn.run(
+        "main:app",
+        host="127.0.0.1",
+        port=8001,
+        workers=max(2, os.cpu_count() or 1),
+        loop="uvloop",
+        http="httptools",
+        log_level="info",
+    )
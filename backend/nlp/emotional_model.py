@@ -1,27 +1,69 @@
 # backend/nlp/emotional_model.py
 
 from transformers import pipeline
+import logging
+import os
 import torch
 
+# ONNX Runtime backend (may not be installed; handled gracefully)
+try:
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer
+except Exception:
+    ORTModelForSequenceClassification = None
+
+log = logging.getLogger(__name__)
+
 
 class EmotionAnalyzer:
     """Emotion analyzer that explicitly loads a named HF model and uses GPU if available.
 
     This avoids the "No model was supplied" note from transformers and ensures
     consistent behavior across environments.
+
+    On CPU hosts, a dynamically-quantized int8 ONNX export (see
+    EMOTION_ONNX_DIR) is preferred when present: roughly 2-4x faster
+    inference and ~4x smaller weights than the FP32 PyTorch pipeline.
     """
 
-    def __init__(self, model_name: str = "j-hartmann/emotion-english-distilroberta-base"):
+    def __init__(
+        self,
+        model_name: str = "j-hartmann/emotion-english-distilroberta-base",
+        onnx_dir: str = None,
+    ):
         # Use GPU device 0 if CUDA is available, otherwise use CPU (-1)
         device = 0 if torch.cuda.is_available() else -1
+        onnx_dir = onnx_dir or os.getenv("EMOTION_ONNX_DIR", "emotion_onnx_int8")
+
+        self._classifier = None
+
+        # Prefer the quantized ONNX export on CPU (the int8 path targets CPU
+        # VNNI; on GPU the PyTorch pipeline is already the fast path).
+        if device == -1 and ORTModelForSequenceClassification is not None and os.path.isdir(onnx_dir):
+            try:
+                model = ORTModelForSequenceClassification.from_pretrained(
+                    onnx_dir, providers=["CPUExecutionProvider"]
+                )
+                tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+                self._classifier = pipeline(
+                    task="text-classification",
+                    model=model,
+                    tokenizer=tokenizer,
+                    return_all_scores=False,
+                )
+                log.info("EmotionAnalyzer using int8 ONNX model from %s.", onnx_dir)
+            except Exception as e:
+                log.warning("ONNX emotion model load error, falling back to PyTorch: %s", e)
+                self._classifier = None
 
-        # Explicitly set task and model to avoid defaulting behavior
-        self._classifier = pipeline(
-            task="text-classification",
-            model=model_name,
-            device=device,
-            return_all_scores=False,
-        )
+        if self._classifier is None:
+            # Explicitly set task and model to avoid defaulting behavior
+            self._classifier = pipeline(
+                task="text-classification",
+                model=model_name,
+                device=device,
+                return_all_scores=False,
+            )
 
     def analyze(self, text: str) -> dict:
         """Returns a dict: {"label": str, "score": float}.
@@ -35,3 +77,22 @@ class EmotionAnalyzer:
         label = result.get("label", "NEUTRAL").upper()
         score = float(result.get("score", 0.0))
         return {"label": label, "score": score}
+
+    def analyze_batch(self, texts: list) -> list:
+        """Batched variant of analyze(): one forward pass for many texts.
+
+        A batch of N costs barely more than a single sample, so coalescing
+        concurrent requests amortises the model's fixed per-pass overhead.
+        """
+        out = [{"label": "NEUTRAL", "score": 0.0} for _ in texts]
+        todo = [(i, t[:512]) for i, t in enumerate(texts) if t and t.strip()]
+        if not todo:
+            return out
+
+        results = self._classifier([t for _, t in todo], batch_size=len(todo))
+        for (i, _), result in zip(todo, results):
+            out[i] = {
+                "label": result.get("label", "NEUTRAL").upper(),
+                "score": float(result.get("score", 0.0)),
+            }
+        return out
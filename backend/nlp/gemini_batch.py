@@ -0,0 +1,161 @@
+# backend/nlp/gemini_batch.py
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Batch Mode lives in the newer google-genai SDK (may not be installed;
+# handled gracefully — callers should check `enabled` and fall back to the
+# synchronous generate_content path).
+try:
+    from google import genai as genai_client
+except Exception:
+    genai_client = None
+
+log = logging.getLogger(__name__)
+
+
+class GeminiBatchQueue:
+    """Queue non-urgent prompts into Gemini Batch Mode submissions.
+
+    Batch Mode runs at 50% of synchronous pricing and outside the per-minute
+    synchronous rate limit, at the cost of minutes-scale turnaround. Prompts
+    accumulate into a JSONL file; once `max_items` are queued or
+    `max_wait_s` has elapsed, the file is uploaded, a batch job is created,
+    and a poller resolves each waiter's future from the job output. Only
+    requests tagged priority="background" should land here — interactive
+    traffic stays on generate_content_async.
+    """
+
+    def __init__(
+        self,
+        model: str = "gemini-1.5-flash",
+        max_items: int = 50,
+        max_wait_s: float = 30.0,
+        poll_interval_s: float = 10.0,
+    ):
+        self.model = model
+        self.max_items = max_items
+        self.max_wait_s = max_wait_s
+        self.poll_interval_s = poll_interval_s
+        self._client = None
+        if genai_client is not None and os.getenv("GEMINI_API_KEY"):
+            try:
+                self._client = genai_client.Client(api_key=os.getenv("GEMINI_API_KEY"))
+            except Exception as e:
+                log.warning("Gemini batch client init error: %s", e)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._batch: List[Tuple[str, str]] = []  # (req_id, jsonl line)
+        self._next_id = 0
+        self._flusher: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._client is not None
+
+    async def submit(self, prompt: str) -> str:
+        """Queue one prompt and wait for its batch result."""
+        if not self.enabled:
+            raise RuntimeError("Gemini Batch Mode is not available")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        async with self._lock:
+            req_id = f"req-{self._next_id}"
+            self._next_id += 1
+            self._pending[req_id] = future
+            self._batch.append(
+                (
+                    req_id,
+                    json.dumps(
+                        {
+                            "key": req_id,
+                            "request": {"contents": [{"parts": [{"text": prompt}]}]},
+                        }
+                    ),
+                )
+            )
+            flush_now = len(self._batch) >= self.max_items
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.ensure_future(self._flush_after_wait())
+        if flush_now:
+            # Detached: the flush (and its minutes-long poll) must not live
+            # inside this request's task, or a client disconnect cancelling
+            # this coroutine would strand every other waiter in the batch.
+            asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush_after_wait(self):
+        await asyncio.sleep(self.max_wait_s)
+        await self._flush()
+
+    async def _flush(self):
+        async with self._lock:
+            if not self._batch:
+                return
+            batch, self._batch = self._batch, []
+        keys = [req_id for req_id, _ in batch]
+        lines = [line for _, line in batch]
+        try:
+            job = await asyncio.to_thread(self._submit_batch, lines)
+            await self._poll(job)
+        except BaseException as e:
+            # BaseException so cancellation also fails the waiters instead of
+            # leaving them pending forever.
+            error = e if isinstance(e, Exception) else RuntimeError("Gemini batch flush cancelled")
+            self._fail_keys(keys, error)
+            if not isinstance(e, Exception):
+                raise
+            return
+        # Any key the job output never mentioned must still be resolved.
+        self._fail_keys(keys, RuntimeError("Gemini batch result missing from job output"))
+
+    def _submit_batch(self, lines):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".jsonl", delete=False
+        ) as f:
+            f.write("\n".join(lines) + "\n")
+            path = f.name
+        try:
+            uploaded = self._client.files.upload(
+                file=path, config={"mime_type": "application/jsonl"}
+            )
+            return self._client.batches.create(model=self.model, src=uploaded.name)
+        finally:
+            os.unlink(path)
+
+    async def _poll(self, job):
+        terminal = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED"}
+        deadline = time.monotonic() + 24 * 3600  # Batch Mode's own SLO
+        while time.monotonic() < deadline:
+            job = await asyncio.to_thread(self._client.batches.get, name=job.name)
+            if job.state.name in terminal:
+                break
+            await asyncio.sleep(self.poll_interval_s)
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            raise RuntimeError(f"Gemini batch job ended in {job.state.name}")
+        content = await asyncio.to_thread(
+            self._client.files.download, file=job.dest.file_name
+        )
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            future = self._pending.pop(result.get("key"), None)
+            if future is None or future.done():
+                continue
+            try:
+                text = result["response"]["candidates"][0]["content"]["parts"][0]["text"]
+                future.set_result(text.strip())
+            except (KeyError, IndexError) as e:
+                future.set_exception(RuntimeError(f"Malformed batch result: {e}"))
+
+    def _fail_keys(self, keys, error):
+        for req_id in keys:
+            future = self._pending.pop(req_id, None)
+            if future is not None and not future.done():
+                future.set_exception(error)
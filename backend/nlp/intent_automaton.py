@@ -0,0 +1,50 @@
+# backend/nlp/intent_automaton.py
+
+import re
+from typing import Optional, Tuple
+
+# (intent, keywords) in priority order — first row wins on a tie, mirroring
+# the original if-chain in detect_intent.
+INTENT_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("exams", ("exam", "test", "college", "study", "fail", "result", "marks", "grades")),
+    ("anxiety", ("anxious", "anxiety", "panic", "fear", "nervous", "scared", "terrified", "overthinking")),
+    ("tiredness", ("tired", "exhausted", "burnt out", "burnout", "sleepy", "no energy", "drained", "fatigued")),
+    ("sadness", ("sad", "hopeless", "lonely", "worthless", "depressed", "depression", "crying", "empty")),
+    ("stress", ("stressed", "stress", "pressure", "overwhelmed")),
+    ("goodbye", ("bye", "goodbye", "see you", "good night", "goodnight", "gn", "got to go")),
+    ("gratitude", ("thanks", "thank you", "thx", "tysm", "ty", "appreciate")),
+    ("greeting", ("hi", "hello", "hey", "good morning", "good afternoon", "good evening")),
+    ("smalltalk", ("how are you", "what's up", "whats up")),
+    ("crisis", ("suicide", "kill myself", "end my life", "self-harm", "hurt myself", "don't want to live")),
+)
+
+_PRIORITY = {intent: i for i, (intent, _) in enumerate(INTENT_KEYWORDS)}
+
+# One compiled scanner with a named group per intent: the regex engine walks
+# the text once in C instead of running dozens of Python-level substring
+# scans. Matches keep the old `keyword in text` substring semantics.
+_SCANNER = re.compile(
+    "|".join(
+        "(?P<{}>{})".format(intent, "|".join(map(re.escape, keywords)))
+        for intent, keywords in INTENT_KEYWORDS
+    )
+)
+
+
+def scan_intent(text: str) -> Optional[str]:
+    """Single linear pass over already-lowercased text.
+
+    Returns the highest-priority intent whose keyword occurs anywhere, or
+    None. Leftmost position does not decide — priority order does, exactly
+    like the original sequential if-chain.
+    """
+    best = None
+    best_priority = len(INTENT_KEYWORDS)
+    for match in _SCANNER.finditer(text):
+        priority = _PRIORITY[match.lastgroup]
+        if priority < best_priority:
+            best = match.lastgroup
+            best_priority = priority
+            if priority == 0:
+                break
+    return best
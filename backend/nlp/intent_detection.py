@@ -2,6 +2,8 @@
 
 from typing import Literal
 
+from nlp.intent_automaton import scan_intent
+
 IntentType = Literal[
     "greeting",
     "smalltalk",
@@ -30,51 +32,14 @@ def detect_intent(text: str) -> IntentType:
     """
     Simplified but powerful rule-based intent detection.
     Returns a single intent string (used by the LLM + templates).
+
+    The keyword table lives in intent_automaton.py, compiled once into a
+    single scanner so each call is one linear pass instead of dozens of
+    substring checks.
     """
     t = text.lower().strip()
 
     if not t:
         return "unknown"
 
-    # --- Exams / academic stress (check early - high priority) ---
-    if any(k in t for k in ["exam", "test", "college", "study", "fail", "result", "marks", "grades"]):
-        return "exams"
-
-    # --- Anxiety ---
-    if any(k in t for k in ["anxious", "anxiety", "panic", "fear", "nervous", "scared", "terrified", "overthinking"]):
-        return "anxiety"
-
-    # --- Tiredness / exhaustion ---
-    if any(k in t for k in ["tired", "exhausted", "burnt out", "burnout", "sleepy", "no energy", "drained", "fatigued"]):
-        return "tiredness"
-
-    # --- Sadness ---
-    if any(k in t for k in ["sad", "hopeless", "lonely", "worthless", "depressed", "depression", "crying", "empty"]):
-        return "sadness"
-
-    # --- Stress ---
-    if any(k in t for k in ["stressed", "stress", "pressure", "overwhelmed"]):
-        return "stress"
-
-    # --- Goodbye ---
-    if any(k in t for k in ["bye", "goodbye", "see you", "good night", "goodnight", "gn", "got to go"]):
-        return "goodbye"
-
-    # --- Gratitude ---
-    if any(k in t for k in ["thanks", "thank you", "thx", "tysm", "ty", "appreciate"]):
-        return "gratitude"
-
-    # --- Greetings ---
-    if any(k in t for k in ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]):
-        return "greeting"
-
-    # --- Small talk ---
-    if any(k in t for k in ["how are you", "what's up", "whats up"]):
-        return "smalltalk"
-
-    # --- Crisis (also handled separately in crisis_detection.py) ---
-    if any(k in t for k in ["suicide", "kill myself", "end my life", "self-harm", "hurt myself", "don't want to live"]):
-        return "crisis"
-
-    # fallback
-    return "unknown"
+    return scan_intent(t) or "unknown"
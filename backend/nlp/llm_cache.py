@@ -0,0 +1,81 @@
+# backend/nlp/llm_cache.py
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+from nlp.semantic_cache import SemanticCache
+
+
+class LLMReplyCache:
+    """Two-tier reply cache in front of the LLM providers.
+
+    Tier 1 is an exact LRU keyed on whatever tuple the caller builds
+    (mode, intent, emotion, normalized message, last-turn hash), with a
+    max-age so stale replies expire. Tier 2 is the embedding-based
+    SemanticCache, which catches near-duplicates the exact key misses.
+    Both tiers answer in microseconds versus a full provider roundtrip.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        max_age_s: float = 600.0,
+        semantic: Optional[SemanticCache] = None,
+    ):
+        self.maxsize = maxsize
+        self.max_age_s = max_age_s
+        self.semantic = semantic if semantic is not None else SemanticCache()
+        # key -> (inserted_at, reply); OrderedDict gives us LRU
+        self._exact: "OrderedDict[Hashable, Tuple[float, str]]" = OrderedDict()
+
+    def _exact_get(self, key: Hashable) -> Optional[str]:
+        entry = self._exact.get(key)
+        if entry is None:
+            return None
+        inserted_at, reply = entry
+        if time.monotonic() - inserted_at > self.max_age_s:
+            del self._exact[key]
+            return None
+        self._exact.move_to_end(key)
+        return reply
+
+    def _exact_put(self, key: Hashable, reply: str) -> None:
+        if len(self._exact) >= self.maxsize:
+            self._exact.popitem(last=False)  # evict least-recently-used
+        self._exact[key] = (time.monotonic(), reply)
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        message: str,
+        intent: str,
+        crisis_flag: bool,
+        compute: Callable[[], Awaitable[Tuple[str, bool]]],
+    ) -> Tuple[str, bool]:
+        """Return (reply, cache_hit).
+
+        `compute` is awaited only on a full miss and must return
+        (reply, cacheable); template/fallback replies pass cacheable=False so
+        they never shadow a real LLM answer.
+        """
+        reply = self._exact_get(key)
+        if reply is not None:
+            return reply, True
+
+        embedding = (
+            await asyncio.to_thread(self.semantic.embed, message)
+            if self.semantic.enabled
+            else None
+        )
+        reply = self.semantic.lookup(embedding, intent, crisis_flag)
+        if reply is not None:
+            self._exact_put(key, reply)
+            return reply, True
+
+        reply, cacheable = await compute()
+        if cacheable:
+            self._exact_put(key, reply)
+            self.semantic.insert(embedding, intent, crisis_flag, reply)
+        return reply, False
@@ -0,0 +1,114 @@
+# backend/nlp/semantic_cache.py
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# sentence-transformers (may not be installed; handled gracefully)
+try:
+    from sentence_transformers import SentenceTransformer
+except Exception:
+    SentenceTransformer = None
+
+log = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Semantic-similarity cache for LLM replies.
+
+    Stores (embedding, intent, crisis_flag, reply) entries and serves a cached
+    reply when a new message is close enough (cosine similarity) to a previous
+    one AND the detected intent / crisis flag match.
+
+    Embeddings live in one contiguous float32 matrix (grown 2x up to maxsize),
+    so a lookup is a single BLAS matrix-vector product over the candidate rows
+    instead of a Python loop of dot products — sub-millisecond even at tens of
+    thousands of entries. Once full, the matrix acts as a ring buffer: new
+    entries overwrite the oldest slot, keeping memory flat.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.92,
+        maxsize: int = 1024,
+    ):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._embs: Optional[np.ndarray] = None  # (capacity, dim) float32
+        self._replies: List[str] = []  # slot -> reply
+        self._slot_group: List[Tuple[str, bool]] = []  # slot -> (intent, crisis)
+        self._groups: Dict[Tuple[str, bool], List[int]] = {}  # group -> slots
+        self._size = 0
+        self._write = 0  # next slot to overwrite once full
+
+        if SentenceTransformer is not None:
+            try:
+                self._embedder = SentenceTransformer(model_name)
+                log.info("SemanticCache initialised with %s.", model_name)
+            except Exception as e:
+                log.warning("SemanticCache embedder init error: %s", e)
+                self._embedder = None
+        else:
+            self._embedder = None
+            log.info("sentence-transformers not installed — semantic cache disabled.")
+
+    @property
+    def enabled(self) -> bool:
+        return self._embedder is not None
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text once per request; returns a unit-normalised vector."""
+        if self._embedder is None:
+            return None
+        vec = self._embedder.encode(text, convert_to_numpy=True)
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return None
+        return (vec / norm).astype(np.float32)
+
+    def _ensure_capacity(self, dim: int) -> None:
+        if self._embs is None:
+            self._embs = np.empty((min(64, self.maxsize), dim), dtype=np.float32)
+        elif self._size == len(self._embs) and self._size < self.maxsize:
+            grown = np.empty(
+                (min(len(self._embs) * 2, self.maxsize), dim), dtype=np.float32
+            )
+            grown[: self._size] = self._embs[: self._size]
+            self._embs = grown
+
+    def lookup(self, embedding: Optional[np.ndarray], intent: str, crisis_flag: bool) -> Optional[str]:
+        """Return a cached reply if the best cosine match clears the threshold."""
+        if embedding is None:
+            return None
+        slots = self._groups.get((intent, crisis_flag))
+        if not slots:
+            return None
+
+        # All embeddings are unit-normalised, so one SGEMV gives the cosines.
+        idx = np.asarray(slots, dtype=np.intp)
+        sims = self._embs[idx] @ embedding
+        best = int(sims.argmax())
+        if float(sims[best]) >= self.threshold:
+            return self._replies[idx[best]]
+        return None
+
+    def insert(self, embedding: Optional[np.ndarray], intent: str, crisis_flag: bool, reply: str) -> None:
+        if embedding is None:
+            return
+        if self._size < self.maxsize:
+            self._ensure_capacity(embedding.shape[0])
+            slot = self._size
+            self._size += 1
+            self._replies.append(reply)
+            self._slot_group.append((intent, crisis_flag))
+        else:
+            # Ring buffer: reclaim the oldest slot from its group
+            slot = self._write
+            self._write = (self._write + 1) % self.maxsize
+            self._groups[self._slot_group[slot]].remove(slot)
+            self._replies[slot] = reply
+            self._slot_group[slot] = (intent, crisis_flag)
+        self._embs[slot] = embedding
+        self._groups.setdefault((intent, crisis_flag), []).append(slot)
@@ -1,20 +1,27 @@
 #!/usr/bin/env python
 """Run Uvicorn server with proper signal handling"""
-import uvicorn
+import os
 import sys
 
+import uvicorn
+
 if __name__ == "__main__":
     try:
-        config = uvicorn.Config(
-            app="main:app",
+        # uvloop (libuv event loop) and httptools (C HTTP parser) replace the
+        # pure-Python stdlib loop and h11 — worth 2-4x throughput on small-
+        # JSON endpoints. workers>1 needs the import-string + uvicorn.run()
+        # form: Server(config).run() cannot supervise multiple processes.
+        uvicorn.run(
+            "main:app",
             host="127.0.0.1",
             port=8001,
+            workers=int(os.getenv("WEB_CONCURRENCY", str(max(2, (os.cpu_count() or 2) // 2)))),
+            loop="uvloop",
+            http="httptools",
             reload=False,
-            log_level="info",
-            access_log=True,
+            log_level="warning",
+            access_log=False,
         )
-        server = uvicorn.Server(config)
-        server.run()
     except Exception as e:
         print(f"Error starting server: {e}", file=sys.stderr)
         sys.exit(1)